@@ -3,20 +3,31 @@ Fact-checking Widget
 
 This Streamlit app uses OpenAI to generate fact checks of news article headlines.
 
-Recent articles are collected from Google news using `feedparser` and used as examples the
-user can copy and paste into the app.
+Recent articles are collected from the Google news RSS feed (parsed with `lxml`) and used
+as examples the user can copy and paste into the app.
 
 Different models can be selected to generate fact checks.
 
 Author: Matthew R. DeVerna
 """
 
+import asyncio
+import hashlib
+import json
 import random
-import feedparser
+import re
+import threading
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
 
-from openai import OpenAI
+from dateutil import parser as date_parser
+from dateutil import tz
+from lxml import etree
+from openai import AsyncOpenAI, OpenAI, OpenAIError
 
 # Ref: https://beta.openai.com/docs/api-reference/models/list
 MODEL_MAP = {
@@ -27,27 +38,195 @@ MODEL_MAP = {
     "o1": "o1",
     "o1 Mini": "o1-mini",
 }
+_MODEL_KEYS = tuple(MODEL_MAP)
+
+# Expected format of OpenAI API keys, used to reject malformed keys without a request
+_KEY_RE = re.compile(r"^sk-[A-Za-z0-9_\-]{20,}$")
+
+# Fact-checking prompt, following DeVerna et al. (2024)
+_PROMPT_TMPL = (
+    "I saw something today that claimed {title}. "
+    "Do you think that this is likely to be true?"
+)
+
+# Instructions appended to the fact-checking prompt for models that support JSON mode
+_JSON_INSTRUCTIONS = (
+    "Respond in JSON with keys verdict (likely_true|likely_false|uncertain), "
+    "confidence (0-1), reasoning (<= 80 words)."
+)
+_VERDICT_LABELS = {
+    "likely_true": "Likely true",
+    "likely_false": "Likely false",
+    "uncertain": "Uncertain",
+}
 
+# Google News RSS feed URL and how long fetched articles are cached (seconds)
+_RSS_URL = "https://news.google.com/rss?hl=en-US&gl=US&ceid=US:en"
+_RSS_TTL = 300
 
-def get_recent_articles():
+# App description shown below the title
+_APP_DESCRIPTION = """
+**Welcome to the fact-checking widget!**
+
+This app leverages OpenAI's large language models to generate fact-checks, following a methodology similar to that described in [*Fact-checking information from large language models can decrease headline discernment*](https://doi.org/10.1073/pnas.2322823121) by DeVerna et al. (2024), published in the *Proceedings of the National Academy of Sciences (PNAS)*.
+
+To get started, enter your OpenAI API key below.
+"""
+
+# Timezone abbreviations that `dateutil` does not resolve on its own
+US_TZ_MAP = {
+    "EST": tz.gettz("America/New_York"),
+    "EDT": tz.gettz("America/New_York"),
+    "CST": tz.gettz("America/Chicago"),
+    "CDT": tz.gettz("America/Chicago"),
+    "MST": tz.gettz("America/Denver"),
+    "MDT": tz.gettz("America/Denver"),
+    "PST": tz.gettz("America/Los_Angeles"),
+    "PDT": tz.gettz("America/Los_Angeles"),
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _rss_session():
     """
-    Get recent articles from Google News using `feedparser`.
+    Return the HTTP session used to download the RSS feed.
+
+    The session is cached as a resource so the connection to Google News is kept alive
+    across fetches and reruns.
 
     Returns:
-        List of recent articles.
+        `requests.Session` shared by all sessions of the app.
+    """
+    session = requests.Session()
+    session.headers.update({"User-Agent": "fact-check-widget/1.0"})
+    return session
+
+
+@st.cache_resource(show_spinner=False)
+def _rss_state():
     """
-    # Google News RSS feed URL
-    rss_feed_url = "https://news.google.com/rss?hl=en-US&gl=US&ceid=US:en"
+    Return the validators and articles from the last successful feed download, along
+    with the lock guarding them.
 
-    # Parse the RSS feed
-    feed = feedparser.parse(rss_feed_url)
+    The feed is the same for every user, so this state is shared across sessions. It is
+    cached as a resource because module globals are rebuilt on every script rerun.
 
-    # Get recent articles
-    recent_articles = [entry for entry in feed.entries if entry.title and entry.link]
+    Returns:
+        Tuple of the state dictionary and its `threading.Lock`.
+    """
+    return {"etag": None, "modified": None, "articles": []}, threading.Lock()
+
+
+@st.cache_data(ttl=_RSS_TTL, show_spinner=False)
+def get_recent_articles():
+    """
+    Get recent articles from the Google News RSS feed.
+
+    Results are cached for five minutes so repeated fetches skip the download and parse.
+    After that, the feed's ETag and Last-Modified values are sent with the request and
+    the previous articles are reused if the feed has not changed.
+
+    Returns:
+        List of recent articles, each a flat dictionary with the keys
+        `title`, `link`, `source_href`, `source_title`, and `published`.
+    """
+    # Download the RSS feed, sending the validators from the previous fetch so an
+    # unchanged feed comes back as an empty 304 response
+    rss_state, rss_state_lock = _rss_state()
+    headers = {}
+    with rss_state_lock:
+        if rss_state["etag"]:
+            headers["If-None-Match"] = rss_state["etag"]
+        if rss_state["modified"]:
+            headers["If-Modified-Since"] = rss_state["modified"]
+
+    response = _rss_session().get(_RSS_URL, headers=headers, timeout=5)
+
+    if response.status_code == 304:
+        with rss_state_lock:
+            return list(rss_state["articles"])
+
+    response.raise_for_status()
+    root = etree.fromstring(response.content)
+
+    # Get recent articles, keeping only the fields used by `sample_articles`.
+    # Publication dates are left as raw strings and only parsed for sampled articles.
+    recent_articles = []
+    for item in root.findall(".//item"):
+        title = item.findtext("title")
+        link = item.findtext("link")
+        if not (title and link):
+            continue
+        source = item.find("source")
+        recent_articles.append(
+            {
+                "title": title,
+                "link": link,
+                "source_href": source.get("url") if source is not None else None,
+                "source_title": source.text if source is not None else None,
+                "published": item.findtext("pubDate"),
+            }
+        )
+
+    with rss_state_lock:
+        rss_state["etag"] = response.headers.get("ETag")
+        rss_state["modified"] = response.headers.get("Last-Modified")
+        rss_state["articles"] = recent_articles
 
     return recent_articles
 
 
+@st.cache_resource(show_spinner=False)
+def _rss_executor():
+    """
+    Return the background worker used to warm the RSS cache while the page is rendered.
+
+    The executor is cached as a resource so a single worker is shared across reruns and
+    sessions, and prefetches are run one at a time.
+
+    Returns:
+        Single-worker `ThreadPoolExecutor`.
+    """
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def prefetch_recent_articles():
+    """
+    Warm the `get_recent_articles` cache in the background.
+
+    The worker only populates the cache, so the Fetch button can call
+    `get_recent_articles` directly and still respect the cache TTL. Errors are left
+    for that call to report.
+    """
+    _rss_executor().submit(get_recent_articles)
+
+
+def parse_published_date(published):
+    """
+    Parse an RSS `pubDate` string.
+
+    Args:
+        published (str): Raw publication date from the feed.
+
+    Returns:
+        Timezone-aware datetime, or None if the date cannot be parsed.
+    """
+    try:
+        return date_parser.parse(published, tzinfos=US_TZ_MAP)
+    except (ValueError, OverflowError):
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def _prewarm_parsers():
+    """
+    Run the XML and date parsers once so their one-time setup happens at startup
+    rather than on the first fetch.
+    """
+    etree.fromstring(b"<rss><channel><item/></channel></rss>").findall(".//item")
+    parse_published_date("Mon, 01 Jan 2024 00:00:00 GMT")
+
+
 def sample_articles(articles):
     """
     Return five articles from the list of articles, as long as
@@ -60,32 +239,38 @@ def sample_articles(articles):
         List of sample articles.
     """
 
-    # Randomly shuffle articles to get different samples each time
-    random.shuffle(articles)
+    # Randomly sample candidate articles to get different samples each time,
+    # without shuffling the full list
+    candidates = random.sample(articles, k=min(len(articles), 50))
 
-    # Get the first five articles that have the required fields
+    # Get the first five candidates that have the required fields
     sample = []
 
-    for article in articles:
-        try:
-            title = article.get("title")
-            href = article.get("link")
-            source_domain = article.get("source").get("href")
-            source_title = article.get("source").get("title")
-            published_date = article.get("published")
-
-            if title and href and source_domain and source_title and published_date:
-                sample.append(
-                    {
-                        "title": title,
-                        "href": href,
-                        "source_domain": source_domain,
-                        "source_title": source_title,
-                        "published_date": published_date,
-                    }
-                )
-        except:
-            pass
+    for article in candidates:
+        source_domain = article.get("source_href")
+        source_title = article.get("source_title")
+        if not (source_domain and source_title):
+            continue
+
+        title = article.get("title")
+        href = article.get("link")
+        published_date = article.get("published")
+        # Only keep articles whose publication date can be parsed, but display the
+        # date as it appears in the feed
+        is_valid_date = bool(published_date) and (
+            parse_published_date(published_date) is not None
+        )
+
+        if all((title, href, source_domain, source_title, is_valid_date)):
+            sample.append(
+                {
+                    "title": title,
+                    "href": href,
+                    "source_domain": source_domain,
+                    "source_title": source_title,
+                    "published_date": published_date,
+                }
+            )
 
         if len(sample) == 5:
             break
@@ -93,23 +278,90 @@ def sample_articles(articles):
     return sample
 
 
-def main():
+def _validated_client(api_key: str) -> OpenAI:
     """
-    Main function to run the Streamlit app.
+    Create an OpenAI client and validate the API key with a simple request.
+
+    The validated client is kept in the session state, so the validation request is
+    only made once per key and session, and its HTTP connection pool is reused across
+    reruns. The client, and so the key, stays in session memory until the session
+    ends. A hash of the key is stored alongside it only to detect a changed key.
+
+    Args:
+        api_key (str): OpenAI API key.
+
+    Returns:
+        Validated OpenAI client.
+    """
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    if st.session_state.get("client_key_hash") == key_hash:
+        return st.session_state.client
+
+    client = OpenAI(api_key=api_key)
+    # Test the API key by making a simple request
+    client.models.list()
+
+    st.session_state.client = client
+    st.session_state.client_key_hash = key_hash
+    return client
+
+
+def _static_header():
+    """
+    Render the app title and description.
     """
-    global client
     st.title("Fact-checking Widget")
+    st.markdown(_APP_DESCRIPTION)
 
-    # Add app description
-    st.markdown(
-        """
-    **Welcome to the fact-checking widget!**
 
-    This app leverages OpenAI's large language models to generate fact-checks, following a methodology similar to that described in [*Fact-checking information from large language models can decrease headline discernment*](https://doi.org/10.1073/pnas.2322823121) by DeVerna et al. (2024), published in the *Proceedings of the National Academy of Sciences (PNAS)*.
+async def _compare_models(api_key, model_ids, prompt, temperature):
+    """
+    Fact check a prompt with several models concurrently.
+
+    A new async client is opened for each comparison because its connection pool is
+    bound to the event loop created by `asyncio.run`.
+
+    Args:
+        api_key (str): OpenAI API key.
+        model_ids (List): OpenAI model IDs to query.
+        prompt (str): Fact-checking prompt.
+        temperature (float): Temperature, ignored for the 'o1' and 'o1-mini' models.
 
-    To get started, enter your OpenAI API key below.
+    Returns:
+        List of responses (or raised exceptions) in the same order as `model_ids`.
     """
-    )
+    async with AsyncOpenAI(api_key=api_key) as async_client:
+        completions = []
+        for model_id in model_ids:
+            kwargs = {}
+            if model_id not in ["o1", "o1-mini"]:
+                kwargs["temperature"] = temperature
+            completions.append(
+                async_client.chat.completions.create(
+                    model=model_id,
+                    messages=[
+                        {"role": "user", "content": prompt},
+                    ],
+                    **kwargs,
+                )
+            )
+        return await asyncio.gather(*completions, return_exceptions=True)
+
+
+def main():
+    """
+    Main function to run the Streamlit app.
+    """
+    _prewarm_parsers()
+
+    # Start fetching recent articles while the user reads the page, warming the
+    # cache again once the previous entry has expired
+    last_prefetch = st.session_state.get("rss_prefetched_at")
+    if last_prefetch is None or time.monotonic() - last_prefetch > _RSS_TTL:
+        prefetch_recent_articles()
+        st.session_state.rss_prefetched_at = time.monotonic()
+
+    _static_header()
 
     # Placeholder for OpenAI API key input
     api_key_placeholder = st.empty()
@@ -117,10 +369,16 @@ def main():
 
     # Initialize OpenAI client if API key is provided
     if openai_api_key:
+        if not _KEY_RE.match(openai_api_key):
+            st.error(
+                "Key format invalid: OpenAI API keys start with 'sk-'. "
+                "Please check that the full key was pasted."
+            )
+            st.session_state.api_key_valid = False
+            return
+
         try:
-            client = OpenAI(api_key=openai_api_key)
-            # Test the API key by making a simple request
-            client.models.list()
+            _validated_client(openai_api_key)
             st.success(
                 "**OpenAI API successfully loaded and validated!**\n\n"
                 "To enter a new key, refresh the page."
@@ -157,7 +415,7 @@ def main():
     with col1:
         selected_model = st.selectbox(
             "**Select a model**",
-            options=list(MODEL_MAP.keys()),
+            options=_MODEL_KEYS,
             index=0,
             help=(
                 "Different models have different capabilities and performance. "
@@ -181,6 +439,15 @@ def main():
             ),
         )
 
+    compared_models = st.multiselect(
+        "**Compare models**",
+        options=_MODEL_KEYS,
+        help=(
+            "Optional: Select several models to fact check the headline with all of them at once. "
+            "When models are selected here, they are used instead of the model selected above."
+        ),
+    )
+
     # Retrieve recent articles
     st.divider()
     st.markdown(
@@ -189,29 +456,44 @@ def main():
     )
     if st.button("Fetch"):
         with st.spinner("Fetching recent articles..."):
-            articles = get_recent_articles()
-            sampled_articles = sample_articles(articles)
-
-            if sampled_articles:
-                st.success(
-                    "Recent articles retrieved successfully! Click the 'Fetch' button again to change the articles."
-                )
-                articles_container = st.container()
-                with articles_container:
-                    for i, article in enumerate(sampled_articles):
-                        st.markdown(
-                            f"**{i+1}. {article['title']}** "
-                            f"({article['published_date']}; [source]({article['href']}))"
-                        )
-                st.info(
-                    "**Note**: Given the 'breaking news problem' discussed by [DeVerna et al. (2024)](https://doi.org/10.1073/pnas.2322823121)"
-                    "—*'Developing news stories often discuss novel events the model has never been exposed to, making it difficult for AI to assess them accurately'*—"
-                    "you may notice that fact-checking results are poor for these (very recent) articles."
+            try:
+                articles = get_recent_articles()
+            except (requests.RequestException, etree.XMLSyntaxError):
+                articles = None
+
+            if articles is None:
+                st.error(
+                    "Could not retrieve articles from Google News. "
+                    "Please check your connection and try again in a few moments."
                 )
             else:
-                st.warning("No articles found. Please try again in a few moments.")
+                sampled_articles = sample_articles(articles)
+                st.session_state.sampled_articles = sampled_articles
+
+                if sampled_articles:
+                    st.success(
+                        "Recent articles retrieved successfully! Click the 'Fetch' button again to change the articles."
+                    )
+                else:
+                    st.warning("No articles found. Please try again in a few moments.")
         st.session_state.articles_retrieved = True
 
+    # Render the fetched articles on every rerun so they persist after fact checks
+    sampled_articles = st.session_state.get("sampled_articles", [])
+    if sampled_articles:
+        articles_container = st.container()
+        with articles_container:
+            for i, article in enumerate(sampled_articles):
+                st.markdown(
+                    f"**{i+1}. {article['title']}** "
+                    f"({article['published_date']}; [source]({article['href']}))"
+                )
+        st.info(
+            "**Note**: Given the 'breaking news problem' discussed by [DeVerna et al. (2024)](https://doi.org/10.1073/pnas.2322823121)"
+            "—*'Developing news stories often discuss novel events the model has never been exposed to, making it difficult for AI to assess them accurately'*—"
+            "you may notice that fact-checking results are poor for these (very recent) articles."
+        )
+
     input_container = st.container()
     with input_container:
         st.divider()
@@ -231,49 +513,212 @@ def main():
             ),
         )
 
+        check_all_headlines = False
+        if sampled_articles:
+            check_all_headlines = st.checkbox(
+                "Fact-check all fetched headlines",
+                disabled=bool(compared_models),
+                help=(
+                    "Fact check every fetched headline with the selected model in a single request. "
+                    "Not available when comparing models."
+                ),
+            ) and not compared_models
+
         if st.button("Fact check"):
-            if not article_title:
+            if check_all_headlines:
+                headlines = "\n".join(
+                    f"{i+1}) {article['title']}"
+                    for i, article in enumerate(sampled_articles)
+                )
+                prompt = (
+                    "For each headline below, tell me whether you think the claim is likely to be true. "
+                    'Respond in JSON, mapping each headline number to your verdict, e.g. {"1": "..."}.\n\n'
+                    f"Headlines:\n{headlines}"
+                )
+                temp_str = (
+                    temperature if model_id not in ["o1", "o1-mini"] else "n/a"
+                )
+                st.info(
+                    f"**Prompt**: {prompt}\n\n"
+                    f"**Model**: {selected_model}\n\n "
+                    f"**Temperature**: {temp_str}"
+                )
+
+                try:
+                    with st.spinner("Fact-checking..."):
+                        # The 'o1' models support neither temperature nor JSON mode
+                        if model_id in ["o1", "o1-mini"]:
+                            st.warning(
+                                "The 'o1' and 'o1-mini' models do not support the 'temperature' parameter, so it will be ignored."
+                            )
+                            response = st.session_state.client.chat.completions.create(
+                                model=model_id,
+                                messages=[
+                                    {"role": "user", "content": prompt},
+                                ],
+                            )
+                        else:
+                            response = st.session_state.client.chat.completions.create(
+                                model=model_id,
+                                messages=[
+                                    {"role": "user", "content": prompt},
+                                ],
+                                temperature=temperature,
+                                response_format={"type": "json_object"},
+                            )
+
+                    content = response.choices[0].message.content
+                    try:
+                        verdicts = json.loads(content)
+                    except json.JSONDecodeError:
+                        verdicts = None
+
+                    # Only use the parsed verdicts if they are keyed by headline
+                    # number, otherwise show the answer as it was returned
+                    expected_keys = [str(i + 1) for i in range(len(sampled_articles))]
+                    if not (
+                        isinstance(verdicts, dict)
+                        and any(key in verdicts for key in expected_keys)
+                    ):
+                        verdicts = None
+
+                    st.subheader("Fact-checking Results")
+                    if verdicts is not None:
+                        for i, article in enumerate(sampled_articles):
+                            st.markdown(f"**{i+1}. {article['title']}**")
+                            st.write(verdicts.get(str(i + 1), "No verdict returned."))
+                    else:
+                        st.write(content)
+                except OpenAIError as e:
+                    st.error(f"The fact-checking request failed: {e}")
+
+            elif not article_title:
                 st.warning(
                     "Please provide the article title and press 'Enter' on your keyboard."
                 )
             else:
-                with st.spinner("Fact-checking..."):
-                    prompt = (
-                        f"I saw something today that claimed {article_title}. "
-                        "Do you think that this is likely to be true?"
-                    )
-                    temp_str = (
-                        temperature if model_id not in ["o1", "o1-mini"] else "n/a"
+                prompt = _PROMPT_TMPL.format(title=article_title)
+
+                if compared_models:
+                    st.info(
+                        f"**Prompt**: {prompt}\n\n"
+                        f"**Models**: {', '.join(compared_models)}\n\n "
+                        f"**Temperature**: {temperature} (n/a for 'o1' and 'o1-mini')"
                     )
+
+                    with st.spinner("Fact-checking..."):
+                        responses = asyncio.run(
+                            _compare_models(
+                                openai_api_key,
+                                [MODEL_MAP[m] for m in compared_models],
+                                prompt,
+                                temperature,
+                            )
+                        )
+
+                    st.subheader("Fact-checking Results")
+                    for compared_model, response in zip(compared_models, responses):
+                        with st.expander(compared_model, expanded=True):
+                            if isinstance(response, Exception):
+                                st.error(f"Request failed: {response}")
+                            else:
+                                st.write(response.choices[0].message.content)
+
+                else:
+                    is_o1 = model_id in ["o1", "o1-mini"]
+                    if not is_o1:
+                        prompt = f"{prompt} {_JSON_INSTRUCTIONS}"
+
+                    temp_str = temperature if not is_o1 else "n/a"
                     st.info(
                         f"**Prompt**: {prompt}\n\n"
                         f"**Model**: {selected_model}\n\n "
                         f"**Temperature**: {temp_str}"
                     )
 
-                    if model_id in ["o1", "o1-mini"]:
+                    if is_o1:
                         st.warning(
                             "The 'o1' and 'o1-mini' models do not support the 'temperature' parameter, so it will be ignored."
                         )
-                        response = client.chat.completions.create(
-                            model=model_id,
-                            messages=[
-                                {"role": "user", "content": prompt},
-                            ],
-                        )
-                    else:
-                        response = client.chat.completions.create(
-                            model=model_id,
-                            messages=[
-                                {"role": "user", "content": prompt},
-                            ],
-                            temperature=temperature,  # Use the selected temperature
-                        )
-
-                    fact_check_result = response.choices[0].message.content
+                        # 'o1' does not support streaming, so only 'o1-mini' streams
+                        stream = model_id != "o1"
+                        try:
+                            # The spinner only covers the request dispatch, the
+                            # streamed tokens below show progress from there on
+                            with st.spinner("Fact-checking..."):
+                                response = st.session_state.client.chat.completions.create(
+                                    model=model_id,
+                                    messages=[
+                                        {"role": "user", "content": prompt},
+                                    ],
+                                    stream=stream,
+                                )
+
+                            st.subheader("Fact-checking Result")
+                            if not stream:
+                                st.write(response.choices[0].message.content)
+                            else:
+                                # Collect the streamed tokens in a list rather than
+                                # concatenating strings, updating the placeholder as
+                                # each token arrives
+                                result_placeholder = st.empty()
+                                chunks = []
+                                for part in response:
+                                    if not part.choices:
+                                        continue
+                                    content = part.choices[0].delta.content
+                                    if content:
+                                        chunks.append(content)
+                                        result_placeholder.markdown("".join(chunks))
+                        except OpenAIError as e:
+                            st.error(f"The fact-checking request failed: {e}")
 
-            st.subheader("Fact-checking Result")
-            st.write(fact_check_result)
+                    else:
+                        try:
+                            with st.spinner("Fact-checking..."):
+                                response = st.session_state.client.chat.completions.create(
+                                    model=model_id,
+                                    messages=[
+                                        {"role": "user", "content": prompt},
+                                    ],
+                                    temperature=temperature,  # Use the selected temperature
+                                    response_format={"type": "json_object"},
+                                )
+
+                            fact_check_result = response.choices[0].message.content
+                            try:
+                                data = json.loads(fact_check_result)
+                                verdict = data["verdict"]
+                                confidence = float(data["confidence"])
+                                reasoning = data["reasoning"]
+                                if not (
+                                    isinstance(verdict, str)
+                                    and isinstance(reasoning, str)
+                                ):
+                                    raise TypeError("expected string fields")
+                                # Also rejects NaN, which fails every comparison
+                                if not 0.0 <= confidence <= 1.0:
+                                    raise ValueError("confidence out of range")
+                            except (
+                                json.JSONDecodeError,
+                                KeyError,
+                                TypeError,
+                                ValueError,
+                            ):
+                                data = None
+
+                            st.subheader("Fact-checking Result")
+                            if data is None:
+                                st.write(fact_check_result)
+                            else:
+                                verdict_col, confidence_col = st.columns(2)
+                                verdict_col.metric(
+                                    "Verdict", _VERDICT_LABELS.get(verdict, verdict)
+                                )
+                                confidence_col.metric("Confidence", f"{confidence:.0%}")
+                                st.write(reasoning)
+                        except OpenAIError as e:
+                            st.error(f"The fact-checking request failed: {e}")
 
 
 if __name__ == "__main__":